@@ -35,31 +35,27 @@ export async function callClaude(apiKey, systemPrompt, userPrompt, model = 'sonn
     debugLog('System prompt length:', systemPrompt.length);
     debugLog('User prompt length:', userPrompt.length);
 
+    // Upstream body is forwarded verbatim by the proxy; the key travels in a header
     const requestBody = {
-        apiKey: apiKey,
-        body: {
-            model: selectedModel,
-            max_tokens: 8192,
-            temperature: 0.7,
-            system: systemPrompt,
-            messages: [
-                {
-                    role: 'user',
-                    content: userPrompt
-                }
-            ]
-        }
+        model: selectedModel,
+        max_tokens: 8192,
+        temperature: 0.7,
+        system: systemPrompt,
+        messages: [
+            {
+                role: 'user',
+                content: userPrompt
+            }
+        ]
     };
 
-    debugLog('Request body structure:', JSON.stringify({
-        ...requestBody,
-        apiKey: '***REDACTED***'
-    }, null, 2).substring(0, 500));
+    debugLog('Request body structure:', JSON.stringify(requestBody, null, 2).substring(0, 500));
 
     const response = await fetch(CLAUDE_API_URL, {
         method: 'POST',
         headers: {
-            'Content-Type': 'application/json'
+            'Content-Type': 'application/json',
+            'x-api-key': apiKey
         },
         body: JSON.stringify(requestBody)
     });
@@ -120,20 +116,18 @@ export async function testClaudeConnection(apiKey) {
         const response = await fetch(CLAUDE_API_URL, {
             method: 'POST',
             headers: {
-                'Content-Type': 'application/json'
+                'Content-Type': 'application/json',
+                'x-api-key': apiKey
             },
             body: JSON.stringify({
-                apiKey: apiKey,
-                body: {
-                    model: CLAUDE_SONNET,
-                    max_tokens: 10,
-                    messages: [
-                        {
-                            role: 'user',
-                            content: 'Hello'
-                        }
-                    ]
-                }
+                model: CLAUDE_SONNET,
+                max_tokens: 10,
+                messages: [
+                    {
+                        role: 'user',
+                        content: 'Hello'
+                    }
+                ]
             })
         });
 
@@ -15,18 +15,16 @@ export async function callNanoBanana(apiKey, imagePrompt) {
     const response = await fetch(GEMINI_API_URL, {
         method: 'POST',
         headers: {
-            'Content-Type': 'application/json'
+            'Content-Type': 'application/json',
+            'x-goog-api-key': apiKey
         },
         body: JSON.stringify({
-            apiKey: apiKey,
-            body: {
-                contents: [{
-                    parts: [{ text: imagePrompt }]
-                }],
-                generationConfig: {
-                    // Include both TEXT and IMAGE modalities as recommended by Google
-                    responseModalities: ['TEXT', 'IMAGE']
-                }
+            contents: [{
+                parts: [{ text: imagePrompt }]
+            }],
+            generationConfig: {
+                // Include both TEXT and IMAGE modalities as recommended by Google
+                responseModalities: ['TEXT', 'IMAGE']
             }
         })
     });
@@ -73,17 +71,15 @@ export async function testGeminiConnection(apiKey) {
         const response = await fetch(GEMINI_API_URL, {
             method: 'POST',
             headers: {
-                'Content-Type': 'application/json'
+                'Content-Type': 'application/json',
+                'x-goog-api-key': apiKey
             },
             body: JSON.stringify({
-                apiKey: apiKey,
-                body: {
-                    contents: [{
-                        parts: [{ text: 'A simple test image of a blue circle' }]
-                    }],
-                    generationConfig: {
-                        responseModalities: ['TEXT', 'IMAGE']
-                    }
+                contents: [{
+                    parts: [{ text: 'A simple test image of a blue circle' }]
+                }],
+                generationConfig: {
+                    responseModalities: ['TEXT', 'IMAGE']
                 }
             })
         });
@@ -4,233 +4,730 @@ Simple HTTP server for Landing Page Builder with API proxy
 Run this to serve the application properly with ES6 module support
 """
 
+import http.client
 import http.server
+from http import HTTPStatus
+import socket
 import socketserver
 import webbrowser
 import os
-import json
+import io
+import gzip
+import base64
+import hashlib
+import functools
+import mmap
+import urllib.parse
 import urllib.request
-import urllib.error
+import re
+import json
+import logging
+import logging.handlers
+import queue
+import ssl
 import threading
+import time
+import datetime
+import email.utils
+from contextlib import contextmanager
 
 PORT = 8000
 
-# Enable multi-threaded request handling for parallel API calls
-class ThreadedTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
-    """Handle each request in a new thread for parallel execution"""
+# Worker threads serving requests (override with HTTP_THREADS)
+HTTP_THREADS = int(os.environ.get('HTTP_THREADS', 32))
+
+# Set LPB_DEBUG=1 to log upstream response previews (buffers a copy of each body)
+DEBUG = bool(os.environ.get('LPB_DEBUG'))
+
+# Largest request body the proxy accepts; bigger uploads get 413
+MAX_BODY_BYTES = 8 * 1024 * 1024
+
+# After a 413, read off at most this much of the refused body so the client
+# finishes its upload and sees the response instead of a connection reset
+MAX_DISCARD_BYTES = 64 * 1024 * 1024
+
+# Upstream bodies are relayed to the client in chunks of this size
+STREAM_CHUNK_SIZE = 65536
+
+# Upstream socket timeouts (seconds) so a stalled API call cannot pin a
+# worker thread indefinitely. Claude sends nothing until generation finishes.
+CLAUDE_TIMEOUT = 300
+GEMINI_TIMEOUT = 60
+
+# Without os.sendfile (Windows) static files are sent from an mmap instead
+HAS_SENDFILE = hasattr(os, 'sendfile')
+
+# Static text assets worth compressing; smaller files go out as-is
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+GZIP_MIN_SIZE = 1024
+
+# Proxy error envelopes, built once; the network one takes an escaped reason
+NETWORK_ERROR_TEMPLATE = b'{"error":{"message":"Network error: %s"}}'
+INTERNAL_ERROR = b'{"error":{"message":"Internal server error"}}'
+
+logger = logging.getLogger('landing-page-builder')
+
+# Idle keep-alive connections kept per upstream host
+UPSTREAM_POOL_SIZE = 32
+
+def network_error(reason):
+    """NETWORK_ERROR_TEMPLATE filled with the JSON-escaped reason"""
+    return NETWORK_ERROR_TEMPLATE % json.dumps(str(reason))[1:-1].encode('utf-8')
+
+
+# Same escaping as the stdlib handler (3.12+) for client-controlled text
+# written to the log, so control characters cannot forge or hide lines
+CONTROL_CHAR_TABLE = str.maketrans(
+    {c: fr'\x{c:02x}' for c in [*range(0x20), *range(0x7f, 0xa0)]})
+CONTROL_CHAR_TABLE[ord('\\')] = r'\\'
+
+
+def peek_json_field(data, key, limit=100):
+    """Return a short preview of the first "key": value in a JSON body.
+
+    A byte scan for log lines, so proxied bodies are never parsed.
+    Control characters are escaped. Returns None when the key is absent.
+    """
+    marker = b'"' + key.encode('utf-8') + b'":'
+    idx = data.find(marker)
+    if idx == -1:
+        return None
+    value = data[idx + len(marker):idx + len(marker) + limit].lstrip()
+    if value.startswith(b'"'):
+        value = value[1:].split(b'"', 1)[0]
+    else:
+        value = re.split(rb'[,}\]\s]', value, maxsplit=1)[0]
+    return value.decode('utf-8', 'replace').translate(CONTROL_CHAR_TABLE)
+
+
+# One TLS context for every upstream connection. Without it each new
+# HTTPSConnection builds its own and reloads the system CA bundle, which
+# adds up when the builder opens several Gemini connections at once.
+UPSTREAM_SSL_CONTEXT = ssl.create_default_context()
+
+
+class UpstreamPool:
+    """Keep-alive HTTPS connections to one upstream host, shared by all workers.
+
+    Reusing a connection skips the TCP and TLS handshakes on every call
+    after the first. A connection goes back to the pool only once its
+    response has been read to the end.
+    """
+
+    def __init__(self, host, timeout=None, maxsize=UPSTREAM_POOL_SIZE):
+        self.host = host
+        self.timeout = timeout
+        self.idle = queue.LifoQueue(maxsize)
+
+    def connect(self):
+        """Open a new connection, tunnelling through HTTPS_PROXY when set.
+
+        Honors the same proxy and no_proxy settings as urllib.request.
+        """
+        proxy = urllib.request.getproxies().get('https')
+        if not proxy or urllib.request.proxy_bypass(self.host):
+            return http.client.HTTPSConnection(
+                self.host, timeout=self.timeout, context=UPSTREAM_SSL_CONTEXT
+            )
+
+        if '://' not in proxy:
+            proxy = 'http://' + proxy
+        proxy = urllib.parse.urlsplit(proxy)
+        conn = http.client.HTTPSConnection(
+            proxy.hostname, proxy.port or 80, timeout=self.timeout, context=UPSTREAM_SSL_CONTEXT
+        )
+        tunnel_headers = {}
+        if proxy.username:
+            credentials = '%s:%s' % (urllib.parse.unquote(proxy.username),
+                                     urllib.parse.unquote(proxy.password or ''))
+            tunnel_headers['Proxy-Authorization'] = 'Basic ' + base64.b64encode(
+                credentials.encode('utf-8')).decode('ascii')
+        conn.set_tunnel(self.host, 443, headers=tunnel_headers)
+        return conn
+
+    @contextmanager
+    def urlopen(self, method, path, body=None, headers=None):
+        """Send a request on a pooled connection and yield the response"""
+        try:
+            conn, reused = self.idle.get_nowait(), True
+        except queue.Empty:
+            conn, reused = self.connect(), False
+
+        try:
+            try:
+                conn.request(method, path, body, headers or {})
+                response = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # The server dropped an idle connection; retry once on a fresh one
+                if not reused:
+                    raise
+                conn.close()
+                conn = self.connect()
+                conn.request(method, path, body, headers or {})
+                response = conn.getresponse()
+            yield response
+        except BaseException:
+            conn.close()
+            raise
+
+        if response.isclosed() and not response.will_close:
+            try:
+                self.idle.put_nowait(conn)
+                return
+            except queue.Full:
+                pass
+        conn.close()
+
+
+CLAUDE_POOL = UpstreamPool('api.anthropic.com', timeout=CLAUDE_TIMEOUT)
+GEMINI_POOL = UpstreamPool('generativelanguage.googleapis.com', timeout=GEMINI_TIMEOUT)
+
+
+@contextmanager
+def mapped_file(f):
+    """Yield a read-only memoryview over an open file's pages.
+
+    Lets hashing, compression and sending work on the page cache directly
+    instead of copying the file into Python bytes first.
+    """
+    if os.fstat(f.fileno()).st_size == 0:
+        # mmap refuses zero-length files
+        yield memoryview(b'')
+        return
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        with memoryview(mm) as view:
+            yield view
+
+
+@functools.lru_cache(maxsize=256)
+def file_etag(path, mtime_ns, size):
+    """Strong ETag from the file's content, cached until it is modified"""
+    with open(path, 'rb') as f, mapped_file(f) as view:
+        digest = hashlib.blake2b(view, digest_size=16)
+    return '"' + digest.hexdigest() + '"'
+
+
+@functools.lru_cache(maxsize=64)
+def gzip_file(path, mtime_ns, size):
+    """Gzip a static file once per modification and keep the bytes"""
+    with open(path, 'rb') as f, mapped_file(f) as view:
+        return gzip.compress(view, mtime=0)
+
+
+def setup_logging():
+    """Route server logs to stderr through a background thread.
+
+    Request threads only enqueue records; the QueueListener thread does the
+    blocking writes. Debug records are skipped unless LPB_DEBUG is set.
+    Returns the started listener so the caller can stop it on shutdown.
+    """
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(logging.DEBUG if DEBUG else logging.INFO)
+    logger.propagate = False
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+    return listener
+
+
+# Multi-threaded request handling for parallel API calls
+class ThreadedTCPServer(socketserver.TCPServer):
+    """Handle requests on a fixed set of worker threads for parallel execution"""
     allow_reuse_address = True
-    daemon_threads = True  # Clean up threads on shutdown
+    request_queue_size = 512  # Listen backlog for bursts of parallel calls
+
+    def __init__(self, *args, **kwargs):
+        if HTTP_THREADS < 1:
+            raise ValueError(f"HTTP_THREADS must be at least 1, got {HTTP_THREADS}")
+        # Set up before binding: a failed bind calls server_close()
+        self.requests = queue.SimpleQueue()
+        self.workers = []
+        super().__init__(*args, **kwargs)
+        # Daemon workers, like ThreadingMixIn's daemon_threads, so Ctrl+C
+        # exits without waiting on idle clients or in-flight API calls
+        self.workers = [
+            threading.Thread(target=self.serve_requests, name=f'http-{i}', daemon=True)
+            for i in range(HTTP_THREADS)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def process_request(self, request, client_address):
+        """Queue the request for the next free worker thread"""
+        self.requests.put((request, client_address))
+
+    def serve_requests(self):
+        """Worker loop: handle queued requests until server_close"""
+        while True:
+            item = self.requests.get()
+            if item is None:
+                return
+            self.process_request_thread(*item)
+
+    def process_request_thread(self, request, client_address):
+        """Same as ThreadingMixIn: serve, report errors, close the socket"""
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        for _ in self.workers:
+            self.requests.put(None)
 
 class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+    # Buffer the status line, headers and small bodies into one send();
+    # with Nagle off, each explicit flush goes out without the 40 ms delay
+    wbufsize = 65536
+    disable_nagle_algorithm = True
+
+    # Client socket timeout (seconds) so an idle or stalled client cannot
+    # hold one of the fixed worker threads indefinitely
+    timeout = 30
+
+    # CORS headers for local development, identical on every response, so
+    # encoded once and appended to the header buffer as raw bytes
+    CORS_HEADERS = (
+        b'Access-Control-Allow-Origin: *\r\n'
+        b'Access-Control-Allow-Methods: GET, POST, OPTIONS\r\n'
+        b'Access-Control-Allow-Headers: Content-Type, x-api-key, x-goog-api-key\r\n'
+    )
+    API_CACHE_CONTROL = b'Cache-Control: no-store, no-cache, must-revalidate\r\n'
+    # Static files are cached but revalidated against their ETag
+    STATIC_CACHE_CONTROL = b'Cache-Control: no-cache\r\n'
+
     def end_headers(self):
-        # Add CORS headers for local development
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, x-api-key, x-goog-api-key')
-        self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate')
+        # No header buffer means an HTTP/0.9 request, which has no headers
+        if hasattr(self, '_headers_buffer'):
+            self._headers_buffer.append(self.CORS_HEADERS)
+            if getattr(self, 'path', '').startswith('/api/'):
+                self._headers_buffer.append(self.API_CACHE_CONTROL)
+            else:
+                self._headers_buffer.append(self.STATIC_CACHE_CONTROL)
         super().end_headers()
 
+    # Request lines and headers are client-controlled too
+    _control_char_table = CONTROL_CHAR_TABLE
+
+    def log_message(self, format, *args):
+        """Send the access log through the queued logger instead of stderr"""
+        message = (format % args).translate(self._control_char_table)
+        logger.info("%s %s", self.address_string(), message)
+
+    def log_error(self, format, *args):
+        """Report protocol errors (bad requests, timeouts) at WARNING"""
+        message = (format % args).translate(self._control_char_table)
+        logger.warning("%s %s", self.address_string(), message)
+
     def do_OPTIONS(self):
         """Handle OPTIONS request for CORS preflight"""
         self.send_response(200)
         self.end_headers()
 
+    def send_head(self):
+        """Serve static files with ETag/Last-Modified revalidation and compression.
+
+        Picks a precompressed .br/.gz companion when the client accepts it,
+        otherwise gzips compressible text on the fly (cached per mtime).
+        Redirects, listings and 404s stay with SimpleHTTPRequestHandler.
+        """
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) and urllib.parse.urlsplit(self.path).path.endswith('/'):
+            path = os.path.join(path, 'index.html')
+        if not os.path.isfile(path):
+            return super().send_head()
+
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            return super().send_head()
+
+        body = f
+        try:
+            fs = os.fstat(f.fileno())
+            ctype = self.guess_type(path)
+            accepted = self.accepted_encodings()
+
+            encoding = None
+            etag = file_etag(path, fs.st_mtime_ns, fs.st_size)
+            for name, ext in (('br', '.br'), ('gzip', '.gz')):
+                companion = path + ext
+                if name in accepted and os.path.isfile(companion):
+                    cs = os.stat(companion)
+                    if cs.st_mtime_ns >= fs.st_mtime_ns:
+                        encoding, body = name, open(companion, 'rb')
+                        length = cs.st_size
+                        break
+            else:
+                compressible = ctype.startswith(COMPRESSIBLE_TYPES)
+                if 'gzip' in accepted and compressible and fs.st_size >= GZIP_MIN_SIZE:
+                    data = gzip_file(path, fs.st_mtime_ns, fs.st_size)
+                    encoding, body, length = 'gzip', io.BytesIO(data), len(data)
+                else:
+                    length = fs.st_size
+
+            if encoding:
+                # Each encoding is a distinct representation with its own tag
+                etag = etag[:-1] + '-' + encoding + '"'
+                f.close()
+
+            if self.etag_matches(etag) or self.not_modified_since(fs.st_mtime):
+                body.close()
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return None
+
+            self.send_response(HTTPStatus.OK)
+            self.send_header('Content-type', ctype)
+            self.send_header('Content-Length', str(length))
+            self.send_header('Last-Modified', self.date_time_string(fs.st_mtime))
+            self.send_header('ETag', etag)
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+            if encoding or ctype.startswith(COMPRESSIBLE_TYPES):
+                self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return body
+        except Exception:
+            f.close()
+            body.close()
+            raise
+
+    def accepted_encodings(self):
+        """Content codings named in Accept-Encoding, minus any refused with q=0"""
+        accepted = set()
+        for token in self.headers.get('Accept-Encoding', '').split(','):
+            coding, *params = [part.strip() for part in token.split(';')]
+            q = 1.0
+            for param in params:
+                name, _, value = param.partition('=')
+                if name.strip().lower() == 'q':
+                    try:
+                        q = float(value)
+                    except ValueError:
+                        q = 0.0
+            if coding and q > 0:
+                accepted.add(coding.lower())
+        return accepted
+
+    def not_modified_since(self, mtime):
+        """If-Modified-Since check from SimpleHTTPRequestHandler.send_head.
+
+        Only consulted without If-None-Match, which takes precedence.
+        """
+        if 'If-Modified-Since' not in self.headers or 'If-None-Match' in self.headers:
+            return False
+        try:
+            ims = email.utils.parsedate_to_datetime(self.headers['If-Modified-Since'])
+        except (TypeError, IndexError, OverflowError, ValueError):
+            return False
+        if ims.tzinfo is None:
+            ims = ims.replace(tzinfo=datetime.timezone.utc)
+        if ims.tzinfo is not datetime.timezone.utc:
+            return False
+        last_modified = datetime.datetime.fromtimestamp(mtime, datetime.timezone.utc)
+        return last_modified.replace(microsecond=0) <= ims
+
+    def etag_matches(self, etag):
+        """Whether If-None-Match names this ETag (weak comparison)"""
+        header = self.headers.get('If-None-Match')
+        if not header:
+            return False
+        tags = [tag.strip() for tag in header.split(',')]
+        return '*' in tags or etag in (tag[2:] if tag.startswith('W/') else tag for tag in tags)
+
+    def copyfile(self, source, outputfile):
+        """Send static files without a Python copy loop.
+
+        socket.sendfile() hands the file to os.sendfile() so the kernel copies
+        pages straight to the socket. Where that is unavailable (Windows) the
+        file is mapped and sent from the page cache in one sendall().
+        """
+        if outputfile is not self.wfile:
+            return super().copyfile(source, outputfile)
+        self.wfile.flush()
+        if HAS_SENDFILE or not isinstance(source, io.BufferedReader):
+            self.connection.sendfile(source)
+            return
+        with mapped_file(source) as view, view[source.tell():] as rest:
+            self.connection.sendall(rest)
+
+    def send_json(self, status, body):
+        """Send a complete JSON body with its Content-Length"""
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        """Read the request body into a single preallocated buffer.
+
+        Bodies over MAX_BODY_BYTES are refused with 413 before anything is
+        allocated. Returns None once an error response has been sent.
+        """
+        try:
+            content_length = int(self.headers['Content-Length'])
+        except (TypeError, ValueError):
+            self.send_error(HTTPStatus.LENGTH_REQUIRED)
+            return None
+        if content_length < 0:
+            self.send_error(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+            return None
+        if content_length > MAX_BODY_BYTES:
+            self.send_error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+            self.close_connection = True
+            self.discard_body(content_length)
+            return None
+
+        body = bytearray(content_length)
+        view = memoryview(body)
+        received = 0
+        while received < content_length:
+            count = self.rfile.readinto(view[received:])
+            if not count:
+                # Client hung up mid-upload; nobody is left to answer
+                logger.warning("request body truncated at %d of %d bytes", received, content_length)
+                self.close_connection = True
+                return None
+            received += count
+        return body
+
+    def discard_body(self, content_length):
+        """Half-close after an early error response and drain the unread body.
+
+        Closing a socket with unread input makes the kernel send RST, which
+        can discard the response before the client reads it. Reading is
+        capped at MAX_DISCARD_BYTES (and the handler timeout) so a huge or
+        stalled upload cannot hold the worker.
+        """
+        remaining = min(content_length, MAX_DISCARD_BYTES)
+        try:
+            self.wfile.flush()
+            self.connection.shutdown(socket.SHUT_WR)
+            while remaining > 0:
+                chunk = self.rfile.read1(min(remaining, STREAM_CHUNK_SIZE))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+        except OSError:
+            pass
+
+    def send_relay_headers(self, response):
+        """Send the 200 headers for an upstream body about to be streamed.
+
+        The upstream Content-Length is forwarded when it has one (i.e. the
+        reply is not chunked), so a body cut short by a failed upstream read
+        shows up as truncated rather than as a complete 200. Chunked replies
+        are delimited by the connection close instead.
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if response.length is not None:
+            self.send_header('Content-Length', str(response.length))
+        self.end_headers()
+
+    def relay_body(self, response, sink=None):
+        """Stream an upstream response body to the client as it arrives.
+
+        Each chunk is flushed as it is read, so the client sees the first
+        bytes without waiting for the rest. Chunks are also appended to
+        ``sink`` when given. Returns bytes relayed.
+        """
+        total = 0
+        while True:
+            chunk = response.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            self.wfile.write(chunk)
+            self.wfile.flush()
+            total += len(chunk)
+            if sink is not None:
+                sink.append(chunk)
+        return total
+
     def do_POST(self):
         """Handle POST requests for API proxy"""
-        if self.path == '/api/claude':
-            self.proxy_claude()
-        elif self.path == '/api/gemini':
-            self.proxy_gemini()
-        else:
-            super().do_POST()
+        proxy = self.POST_ROUTES.get(self.path)
+        if proxy is None:
+            # SimpleHTTPRequestHandler has no do_POST; answer as it would
+            self.send_error(HTTPStatus.NOT_IMPLEMENTED, "Unsupported method ('POST')")
+            return
+        proxy(self)
 
     def proxy_claude(self):
-        """Proxy requests to Anthropic Claude API with comprehensive debug logging"""
-        import sys
-
+        """Proxy requests to Anthropic Claude API"""
+        streaming = False
         try:
-            # Read request body
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            request_data = json.loads(post_data.decode('utf-8'))
-
-            # Extract API key and request body
-            api_key = request_data.get('apiKey')
-            body = request_data.get('body')
-
-            # LOG REQUEST (with redacted API key)
-            print("\n" + "="*60, file=sys.stderr)
-            print("[ClaudeProxy] CLAUDE API REQUEST", file=sys.stderr)
-            print("="*60, file=sys.stderr)
-            print(f"Model: {body.get('model')}", file=sys.stderr)
-            print(f"Max tokens: {body.get('max_tokens')}", file=sys.stderr)
-            print(f"Temperature: {body.get('temperature')}", file=sys.stderr)
-            print(f"API key present: {'Yes' if api_key else 'No'}", file=sys.stderr)
-            print(f"API key prefix: {api_key[:15]}..." if api_key else "N/A", file=sys.stderr)
-            print("="*60 + "\n", file=sys.stderr)
+            # Body is the upstream request as-is; the key arrives in a header
+            body = self.read_body()
+            if body is None:
+                return
+            api_key = self.headers.get('x-api-key', '')
+
+            logger.info(
+                "claude req model=%s max_tokens=%s kb=%d key=%s",
+                peek_json_field(body, 'model'), peek_json_field(body, 'max_tokens'),
+                len(body) // 1024, 'yes' if api_key else 'no'
+            )
 
             # Make request to Claude API (updated to latest API version)
-            req = urllib.request.Request(
-                'https://api.anthropic.com/v1/messages',
-                data=json.dumps(body).encode('utf-8'),
-                headers={
-                    'Content-Type': 'application/json',
-                    'x-api-key': api_key,
-                    'anthropic-version': '2023-06-01'  # Latest stable version
-                }
-            )
+            headers = {
+                'Content-Type': 'application/json',
+                'x-api-key': api_key,
+                'anthropic-version': '2023-06-01'  # Latest stable version
+            }
 
-            with urllib.request.urlopen(req) as response:
-                response_data = response.read()
-                response_text = response_data.decode('utf-8')
-
-                # LOG RESPONSE
-                print("\n" + "="*60, file=sys.stderr)
-                print("[ClaudeProxy] CLAUDE API RESPONSE", file=sys.stderr)
-                print("="*60, file=sys.stderr)
-                print(f"Status: {response.status}", file=sys.stderr)
-                print(f"Content-Type: {response.headers.get('Content-Type')}", file=sys.stderr)
-                print(f"Content-Length: {len(response_data)} bytes", file=sys.stderr)
-                print(f"\nResponse preview (first 500 chars):", file=sys.stderr)
-                print(response_text[:500], file=sys.stderr)
-                print(f"\nResponse preview (last 200 chars):", file=sys.stderr)
-                print(response_text[-200:], file=sys.stderr)
-
-                # Check for markdown in the response
-                if '```json' in response_text or '```' in response_text:
-                    print("\n⚠️  WARNING: Response contains markdown code blocks!", file=sys.stderr)
-
-                # Parse and analyze content
-                try:
-                    parsed = json.loads(response_text)
-                    if 'content' in parsed and len(parsed['content']) > 0:
-                        content_text = parsed['content'][0].get('text', '')
-                        print(f"\nContent text length: {len(content_text)} chars", file=sys.stderr)
-                        print(f"Content text preview (first 300 chars):", file=sys.stderr)
-                        print(content_text[:300], file=sys.stderr)
-
-                        # Check if the CONTENT TEXT contains markdown wrapping
-                        if '```json' in content_text or '```' in content_text:
-                            print("\n🚨 CRITICAL: Content text contains markdown wrapping!", file=sys.stderr)
-                            print("This will need to be parsed by the response-parser.js", file=sys.stderr)
-                except Exception as e:
-                    print(f"\n❌ Response is not valid JSON: {e}", file=sys.stderr)
-
-                print("="*60 + "\n", file=sys.stderr)
-
-                # Send response with proper headers
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/json')
-                self.send_header('Content-Length', str(len(response_data)))
-                self.end_headers()
-                self.wfile.write(response_data)
-
-        except urllib.error.HTTPError as e:
-            # LOG ERROR
-            error_body = e.read()
-            error_text = error_body.decode('utf-8')
-            print(f"\n❌ CLAUDE API ERROR: {e.code}", file=sys.stderr)
-            print(f"Error body: {error_text[:500]}", file=sys.stderr)
-
-            self.send_response(e.code)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Content-Length', str(len(error_body)))
-            self.end_headers()
-            self.wfile.write(error_body)
+            start_time = time.time()
+            with CLAUDE_POOL.urlopen('POST', '/v1/messages', body, headers) as response:
+                if response.status >= 400:
+                    # Forward error response
+                    error_body = response.read()
+                    logger.warning(
+                        "claude error status=%d body=%s",
+                        response.status, error_body[:500].decode('utf-8', 'replace')
+                    )
+                    self.send_json(response.status, error_body)
+                    return
+
+                # Send headers up front and stream the body through
+                self.send_relay_headers(response)
+                streaming = True
+
+                chunks = [] if DEBUG else None
+                size = self.relay_body(response, chunks)
+                logger.info(
+                    "claude resp status=%d kb=%d secs=%.2f",
+                    response.status, size // 1024, time.time() - start_time
+                )
+
+                if DEBUG:
+                    self.log_claude_response(response, b''.join(chunks))
+
+        except (OSError, http.client.HTTPException) as e:
+            # Network/timeout error
+            logger.error("claude network error: %s", e)
+            if streaming:
+                return
+            self.send_json(500, network_error(e))
         except Exception as e:
-            # LOG EXCEPTION
-            print(f"\n❌ PROXY EXCEPTION: {type(e).__name__}: {e}", file=sys.stderr)
-            import traceback
-            traceback.print_exc(file=sys.stderr)
+            # Traceback only under LPB_DEBUG; formatting it is not free
+            logger.error("claude proxy error: %s: %s", type(e).__name__, e, exc_info=DEBUG)
+
+            # Headers already went out; the client sees a truncated body
+            if streaming:
+                return
+
+            # Internal server error; details stay in the server log
+            self.send_json(500, INTERNAL_ERROR)
+
+    def log_claude_response(self, response, response_data):
+        """Log an analysis of a Claude response body (LPB_DEBUG only).
+
+        Works on the raw bytes: the content text preview is sliced straight
+        out of the body instead of deserializing the whole response.
+        """
+        lines = [
+            "claude response analysis",
+            f"Content-Type: {response.headers.get('Content-Type')}",
+            f"Response preview (first 500 bytes): {response_data[:500].decode('utf-8', 'replace')}",
+            f"Response preview (last 200 bytes): {response_data[-200:].decode('utf-8', 'replace')}",
+        ]
+
+        # Check for markdown in the response (```json is covered by ```)
+        if response_data.find(b'```') != -1:
+            lines.append("WARNING: Response contains markdown code blocks")
+
+        # Pull the first content block's text without parsing the JSON
+        idx = response_data.find(b'"text":')
+        if idx == -1:
+            lines.append("Response has no content text field")
+        else:
+            start = response_data.find(b'"', idx + 7) + 1
+            preview = response_data[start:start + 300]
+            lines.append(f"Content text preview (first 300 bytes, JSON-escaped): {preview.decode('utf-8', 'replace')}")
 
-            # Internal server error
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            error_response = json.dumps({'error': {'message': str(e)}})
-            self.wfile.write(error_response.encode('utf-8'))
+            # Check if the CONTENT TEXT starts with markdown wrapping
+            if b'```' in preview:
+                lines.append("CRITICAL: Content text contains markdown wrapping; response-parser.js must unwrap it")
+
+        logger.debug("\n".join(lines))
 
     def proxy_gemini(self):
         """Proxy requests to Google Gemini API (Gemini 2.5 Flash Image - NanoBanana)"""
-        import sys
-        import time
-
+        streaming = False
         try:
-            # Read request body
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            request_data = json.loads(post_data.decode('utf-8'))
-
-            # Extract API key and request body
-            api_key = request_data.get('apiKey')
-            body = request_data.get('body')
-
-            # Log request
-            print("\n" + "="*60, file=sys.stderr)
-            print("[GeminiProxy] IMAGE GENERATION REQUEST", file=sys.stderr)
-            print("="*60, file=sys.stderr)
-            prompt_text = body.get('contents', [{}])[0].get('parts', [{}])[0].get('text', 'N/A')
-            print(f"Prompt: {prompt_text[:100]}...", file=sys.stderr)
-            print(f"API key present: {'Yes' if api_key else 'No'}", file=sys.stderr)
+            # Body is the upstream request as-is; the key arrives in a header
+            body = self.read_body()
+            if body is None:
+                return
+            api_key = self.headers.get('x-goog-api-key', '')
+
+            logger.info(
+                "gemini req prompt=%r kb=%d key=%s",
+                peek_json_field(body, 'text'), len(body) // 1024, 'yes' if api_key else 'no'
+            )
 
             # Make request to Gemini API - using the preview model
             # Model: gemini-2.5-flash-image-preview (NanoBanana v1)
-            url = 'https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-image-preview:generateContent'
-            print(f"Endpoint: {url}", file=sys.stderr)
-
-            req = urllib.request.Request(
-                url,
-                data=json.dumps(body).encode('utf-8'),
-                headers={
-                    'Content-Type': 'application/json',
-                    'x-goog-api-key': api_key
-                }
-            )
+            path = '/v1beta/models/gemini-2.5-flash-image-preview:generateContent'
+            headers = {
+                'Content-Type': 'application/json',
+                'x-goog-api-key': api_key
+            }
 
             start_time = time.time()
-            with urllib.request.urlopen(req, timeout=60) as response:
-                response_data = response.read()
-                elapsed = time.time() - start_time
-
-                print(f"✅ Response received in {elapsed:.2f}s", file=sys.stderr)
-                print(f"Response size: {len(response_data)} bytes", file=sys.stderr)
-                print("="*60 + "\n", file=sys.stderr)
-
-                self.send_response(200)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(response_data)
-
-        except urllib.error.HTTPError as e:
-            # Forward error response
-            error_body = e.read()
-            error_text = error_body.decode('utf-8')
-            print(f"\n❌ GEMINI API ERROR: {e.code}", file=sys.stderr)
-            print(f"Error: {error_text[:500]}", file=sys.stderr)
-            self.send_response(e.code)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(error_body)
-        except urllib.error.URLError as e:
+            with GEMINI_POOL.urlopen('POST', path, body, headers) as response:
+                if response.status >= 400:
+                    # Forward error response
+                    error_body = response.read()
+                    logger.warning(
+                        "gemini error status=%d body=%s",
+                        response.status, error_body[:500].decode('utf-8', 'replace')
+                    )
+                    self.send_json(response.status, error_body)
+                    return
+
+                self.send_relay_headers(response)
+                streaming = True
+
+                size = self.relay_body(response)
+                logger.info(
+                    "gemini resp status=%d kb=%d secs=%.2f",
+                    response.status, size // 1024, time.time() - start_time
+                )
+
+        except (OSError, http.client.HTTPException) as e:
             # Network/timeout error
-            print(f"\n❌ GEMINI NETWORK ERROR: {e.reason}", file=sys.stderr)
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            error_response = json.dumps({'error': {'message': f'Network error: {e.reason}'}})
-            self.wfile.write(error_response.encode('utf-8'))
+            logger.error("gemini network error: %s", e)
+            if streaming:
+                return
+            self.send_json(500, network_error(e))
         except Exception as e:
             # Internal server error
-            print(f"\n❌ GEMINI PROXY ERROR: {type(e).__name__}: {e}", file=sys.stderr)
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            error_response = json.dumps({'error': {'message': str(e)}})
-            self.wfile.write(error_response.encode('utf-8'))
+            logger.error("gemini proxy error: %s: %s", type(e).__name__, e, exc_info=DEBUG)
+            if streaming:
+                return
+            self.send_json(500, INTERNAL_ERROR)
+
+    # API proxy routes, looked up once per POST
+    POST_ROUTES = {
+        '/api/claude': proxy_claude,
+        '/api/gemini': proxy_gemini,
+    }
 
 def main():
     # Change to the directory containing this script
     os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    log_listener = setup_logging()
 
     with ThreadedTCPServer(("", PORT), MyHTTPRequestHandler) as httpd:
         url = f"http://localhost:{PORT}"
@@ -251,6 +748,8 @@ def main():
             httpd.serve_forever()
         except KeyboardInterrupt:
             print("\n\n👋 Server stopped")
+        finally:
+            log_listener.stop()
 
 if __name__ == "__main__":
     main()
@@ -40,13 +40,14 @@ describe('callClaude', () => {
     expect(options.headers['Content-Type']).toBe('application/json');
 
     const body = JSON.parse(options.body);
-    expect(body.apiKey).toBe('test-key');
-    expect(body.body.model).toBe('claude-sonnet-4-5');
-    expect(body.body.max_tokens).toBe(8192);
-    expect(body.body.temperature).toBe(0.7);
-    expect(body.body.system).toBe('system prompt');
-    expect(body.body.messages[0].role).toBe('user');
-    expect(body.body.messages[0].content).toBe('user prompt');
+    expect(body.apiKey).toBeUndefined();
+    expect(options.headers['x-api-key']).toBe('test-key');
+    expect(body.model).toBe('claude-sonnet-4-5');
+    expect(body.max_tokens).toBe(8192);
+    expect(body.temperature).toBe(0.7);
+    expect(body.system).toBe('system prompt');
+    expect(body.messages[0].role).toBe('user');
+    expect(body.messages[0].content).toBe('user prompt');
 
     expect(result).toEqual(mockResponse);
   });
@@ -63,7 +64,7 @@ describe('callClaude', () => {
     await callClaude('test-key', 'system', 'user', 'haiku');
 
     const body = JSON.parse(mockFetch.mock.calls[0][1].body);
-    expect(body.body.model).toBe('claude-haiku-4-5-20251001');
+    expect(body.model).toBe('claude-haiku-4-5-20251001');
   });
 
   it('should default to sonnet model when no model specified', async () => {
@@ -78,7 +79,7 @@ describe('callClaude', () => {
     await callClaude('test-key', 'system', 'user');
 
     const body = JSON.parse(mockFetch.mock.calls[0][1].body);
-    expect(body.body.model).toBe('claude-sonnet-4-5');
+    expect(body.model).toBe('claude-sonnet-4-5');
   });
 
   it('should throw ClaudeApiError on non-ok response', async () => {
@@ -228,9 +229,10 @@ describe('testClaudeConnection', () => {
     expect(options.method).toBe('POST');
 
     const body = JSON.parse(options.body);
-    expect(body.apiKey).toBe('test-api-key');
-    expect(body.body.max_tokens).toBe(10);
-    expect(body.body.messages[0].content).toBe('Hello');
+    expect(body.apiKey).toBeUndefined();
+    expect(options.headers['x-api-key']).toBe('test-api-key');
+    expect(body.max_tokens).toBe(10);
+    expect(body.messages[0].content).toBe('Hello');
   });
 });
 
@@ -52,9 +52,10 @@ describe('callNanoBanana', () => {
     expect(options.headers['Content-Type']).toBe('application/json');
 
     const body = JSON.parse(options.body);
-    expect(body.apiKey).toBe('test-key');
-    expect(body.body.contents[0].parts[0].text).toBe('A beautiful image');
-    expect(body.body.generationConfig.responseModalities).toEqual(['TEXT', 'IMAGE']);
+    expect(body.apiKey).toBeUndefined();
+    expect(options.headers['x-goog-api-key']).toBe('test-key');
+    expect(body.contents[0].parts[0].text).toBe('A beautiful image');
+    expect(body.generationConfig.responseModalities).toEqual(['TEXT', 'IMAGE']);
 
     expect(result).toBeInstanceOf(Blob);
   });
@@ -242,9 +243,10 @@ describe('testGeminiConnection', () => {
     expect(options.method).toBe('POST');
 
     const body = JSON.parse(options.body);
-    expect(body.apiKey).toBe('test-api-key');
-    expect(body.body.contents[0].parts[0].text).toBe('A simple test image of a blue circle');
-    expect(body.body.generationConfig.responseModalities).toEqual(['TEXT', 'IMAGE']);
+    expect(body.apiKey).toBeUndefined();
+    expect(options.headers['x-goog-api-key']).toBe('test-api-key');
+    expect(body.contents[0].parts[0].text).toBe('A simple test image of a blue circle');
+    expect(body.generationConfig.responseModalities).toEqual(['TEXT', 'IMAGE']);
   });
 });
 